@@ -1,10 +1,17 @@
 import asyncio
-import itertools
+import collections
+import logging
 
-from typing import List
+from typing import List, Tuple
 import math
 import numpy as np
-from scipy.stats import linregress
+
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        """Run the decorated function as plain Python when Numba is not installed."""
+        return lambda function: function
 
 from ready_trader_go import BaseAutoTrader, Instrument, Lifespan, MAXIMUM_ASK, MINIMUM_BID, Side
 
@@ -14,37 +21,68 @@ POSITION_LIMIT = 100
 TICK_SIZE_IN_CENTS = 100
 MIN_BID_NEAREST_TICK = (MINIMUM_BID + TICK_SIZE_IN_CENTS) // TICK_SIZE_IN_CENTS * TICK_SIZE_IN_CENTS
 MAX_ASK_NEAREST_TICK = MAXIMUM_ASK // TICK_SIZE_IN_CENTS * TICK_SIZE_IN_CENTS
+VARIANCE_LOOKBACK = 10
+
+# Avellaneda-Stoikov parameters and the spread term that depends only on them
+GAMMA = 0.05
+K_LIQ = 1.0
+_AS_LOG_TERM = (2.0 / GAMMA) * math.log(1.0 + GAMMA / K_LIQ)
+
+
+# Given an explicit signature, Numba compiles (or loads from its cache) at import
+# time, before the trader connects, instead of on the first order book update
+@njit("UniTuple(int64, 2)(float64, int64, float64, float64, float64, float64, int64)", cache=True)
+def _as_quotes(s: float, q: int, gamma: float, var: float, T: float, log_term: float, tick: int) -> Tuple[int, int]:
+    """Return the Avellaneda-Stoikov bid and ask prices in cents for a mid price s in ticks."""
+    # The inventory skew and the spread share the gamma * var * T term
+    risk = gamma * var * T
+
+    # Reservation pricing
+    r = s - q * risk
+
+    # Half of the bid ask spread
+    half_delta = 0.5 * (risk + log_term)
+
+    return int(math.ceil(r - half_delta)) * tick, int(math.ceil(r + half_delta)) * tick
 
 
 class AutoTrader(BaseAutoTrader):
     def __init__(self, loop: asyncio.AbstractEventLoop, team_name: str, secret: str):
         """Initialise a new instance of the AutoTrader class."""
         super().__init__(loop, team_name, secret)
-        self.order_ids = itertools.count(1)
-        self.bids = set()
-        self.asks = set()
+        self._next_id = 1  # Next client order id
+        # Live orders mapped to 1 for bids and -1 for asks, with a count per side
+        self._open = {}
+        self._n_bids = self._n_asks = 0
         self.ask_id = self.ask_price = self.bid_id = self.bid_price = self.position = 0
-        self.hedge_bids = set()
-        self.hedge_asks = set()
         self.hedge_position = 0
 
-        self.mid_prices = []
+        # Rolling window of mid prices with running sums for its variance (mid
+        # prices sit on a half tick grid so the sums stay exact as they slide)
+        self.mid_prices = collections.deque(maxlen=VARIANCE_LOOKBACK)
+        self._mid_sum = self._mid_sum_sq = 0.0
         self.T = 1 # Reserve pricing time
 
-        # Previous prices on Orderbook
-        self.bid_prices = np.array([])
-        self.ask_prices = np.array([])
+        # Order book liquidity density and the (2 / gamma) * ln(1 + gamma / k)
+        # spread term, which only needs recomputing when k changes
+        self.k = K_LIQ
+        self._log_term = _AS_LOG_TERM
 
-        # At what price / volume our orders were filled
-        self.orders_history = {"price": 0, "volume": 0}
-
-        self.bid_volume = []
-        self.ask_volume = []
+        # Previous prices on Orderbook, kept in fixed size ring buffers. Each
+        # price is written twice, cap apart, so the latest window is always one
+        # contiguous slice
+        self._price_cap = 4096
+        self._price_idx = 0
+        self._price_count = 0
+        self.bid_prices = np.empty(2 * self._price_cap, np.int64)
+        self.ask_prices = np.empty(2 * self._price_cap, np.int64)
 
         self.BID_LOT_SIZE = 10
         self.ASK_LOT_SIZE = 10
         self.steps = 0
 
+        # Best bid, best ask and position at the last requote
+        self._last_inputs = (0, 0, 0)
 
     def on_error_message(self, client_order_id: int, error_message: bytes) -> None:
         """Called when the exchange detects an error.
@@ -53,7 +91,7 @@ class AutoTrader(BaseAutoTrader):
         will identify that order, otherwise the client_order_id will be zero.
         """
         self.logger.warning("error with order %d: %s", client_order_id, error_message.decode())
-        if client_order_id != 0 and (client_order_id in self.bids or client_order_id in self.asks):
+        if client_order_id != 0 and client_order_id in self._open:
             self.on_order_status_message(client_order_id, 0, 0, 0)
 
     def on_hedge_filled_message(self, client_order_id: int, price: int, volume: int) -> None:
@@ -63,8 +101,9 @@ class AutoTrader(BaseAutoTrader):
         which may be better than the order's limit price. The volume is
         the number of lots filled at that price.
         """
-        self.logger.info("received hedge filled for order %d with average price %d and volume %d", client_order_id,
-                         price, volume)
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info("received hedge filled for order %d with average price %d and volume %d",
+                             client_order_id, price, volume)
 
     def on_order_book_update_message(self, instrument: int, sequence_number: int, ask_prices: List[int],
                                      ask_volumes: List[int], bid_prices: List[int], bid_volumes: List[int]) -> None:
@@ -75,8 +114,9 @@ class AutoTrader(BaseAutoTrader):
         prices are reported along with the volume available at each of those
         price levels.
         """
-        self.logger.info("received order book for instrument %d with sequence number %d", instrument,
-                         sequence_number)
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info("received order book for instrument %d with sequence number %d", instrument,
+                             sequence_number)
 
         if len(bid_prices) == 0 or len(ask_prices) == 0 or bid_prices[0] == 0 or ask_prices[0] == 0:
             return
@@ -95,57 +135,85 @@ class AutoTrader(BaseAutoTrader):
             
             s = (bid_prices[0] + ask_prices[0]) / (2 * TICK_SIZE_IN_CENTS) # mid price in $
             q = 0
-            gamma = 0.05
-            var = 0
-            k = 1
+            var = 0.0
             if self.T > 0:
                 self.T -= 0.002
             else:
                 self.T = 0.000001
 
             if int(s) != 0:
+                if len(self.mid_prices) == VARIANCE_LOOKBACK:
+                    old = self.mid_prices[0]
+                    self._mid_sum -= old
+                    self._mid_sum_sq -= old * old
                 self.mid_prices.append(s)
+                self._mid_sum += s
+                self._mid_sum_sq += s * s
 
-            lookback = 10
-
-            if len(self.mid_prices) >= lookback:
-                var = np.var(self.mid_prices[-1:-lookback - 1:-1])
+            if len(self.mid_prices) == VARIANCE_LOOKBACK:
+                mean = self._mid_sum / VARIANCE_LOOKBACK
+                var = max(self._mid_sum_sq / VARIANCE_LOOKBACK - mean * mean, 0.0)
                 q = self.position
 
-            # Reservation pricing
-            r = s - (q * gamma * var * self.T)
+            # Add prices ahead of the requote check, so they are kept on every update
+            i = self._price_idx
+            self.bid_prices[i] = self.bid_prices[i + self._price_cap] = bid_prices[0]
+            self.ask_prices[i] = self.ask_prices[i + self._price_cap] = ask_prices[0]
+            self._price_idx = (i + 1) % self._price_cap
+            self._price_count = min(self._price_count + 1, self._price_cap)
 
-			# Bid ask spread
-            delta = (gamma * var * self.T + (2 / gamma * math.log(1 + (gamma / k))))
+            # While both quotes are resting, leave them alone until the top of
+            # the book or our position moves; drift in var and T alone waits
+            inputs = (bid_prices[0], ask_prices[0], self.position)
+            if inputs == self._last_inputs and self.bid_id != 0 and self.ask_id != 0:
+                return
+            self._last_inputs = inputs
 
             # Prices to be sent in
-            new_bid_price = math.ceil((r - delta / 2)) * TICK_SIZE_IN_CENTS
-            new_ask_price = math.ceil((r + delta / 2)) * TICK_SIZE_IN_CENTS
-
-            if self.bid_id != 0 and new_bid_price not in (self.bid_price, 0):
+            new_bid_price, new_ask_price = _as_quotes(s, q, GAMMA, var, self.T, self._log_term, TICK_SIZE_IN_CENTS)
+
+            # Decide on each side once: replace a quote whose price moved, and
+            # only quote if a fill would keep us inside the position limit. An
+            # amend can only reduce an order's volume, so a new price always
+            # means a cancel followed by a fresh insert
+            position = self.position
+            cancel_bid = self.bid_id != 0 and new_bid_price != self.bid_price and new_bid_price != 0
+            cancel_ask = self.ask_id != 0 and new_ask_price != self.ask_price and new_ask_price != 0
+            can_bid = new_bid_price != 0 and position + LOT_SIZE * (self._n_bids + 1) <= POSITION_LIMIT
+            can_ask = new_ask_price != 0 and position - LOT_SIZE * (self._n_asks + 1) >= -POSITION_LIMIT
+
+            if cancel_bid:
                 self.send_cancel_order(self.bid_id)
                 self.bid_id = 0
-            if self.ask_id != 0 and new_ask_price not in (self.ask_price, 0):
+            if cancel_ask:
                 self.send_cancel_order(self.ask_id)
                 self.ask_id = 0
 
-            if self.bid_id == 0 and new_bid_price != 0 and self.position <= POSITION_LIMIT - (LOT_SIZE * len(self.bids) + LOT_SIZE):
-                self.bid_id = next(self.order_ids)
+            if can_bid and self.bid_id == 0:
+                self.bid_id = self._next_id
+                self._next_id += 1
                 self.bid_price = new_bid_price
                 self.send_insert_order(self.bid_id, Side.BUY, new_bid_price, self.BID_LOT_SIZE, Lifespan.GOOD_FOR_DAY)
-                self.bids.add(self.bid_id)
+                self._open[self.bid_id] = 1
+                self._n_bids += 1
 
-            if self.ask_id == 0 and new_ask_price != 0 and self.position >= -POSITION_LIMIT + (LOT_SIZE * len(self.asks) + LOT_SIZE):
-                self.ask_id = next(self.order_ids)
+            if can_ask and self.ask_id == 0:
+                self.ask_id = self._next_id
+                self._next_id += 1
                 self.ask_price = new_ask_price
                 self.send_insert_order(self.ask_id, Side.SELL, new_ask_price, self.ASK_LOT_SIZE, Lifespan.GOOD_FOR_DAY)
-                self.asks.add(self.ask_id)
+                self._open[self.ask_id] = -1
+                self._n_asks += 1
 
-            # Add volume at the end and prices after sending order
-            self.bid_volume.append(sum(bid_volumes))
-            self.ask_volume.append(sum(ask_volumes))
-            self.ask_prices = np.append(self.ask_prices, ask_prices[0])
-            self.bid_prices = np.append(self.bid_prices, bid_prices[0])
+    def _recent_prices(self, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return views of the last n best bid and best ask prices, oldest first.
+
+        The views are contiguous and never copied, so rolling statistics over
+        several windows can be taken with numpy's sliding_window_view on them.
+        """
+        end = self._price_idx + self._price_cap
+        start = end - min(n, self._price_count)
+        return self.bid_prices[start:end], self.ask_prices[start:end]
 
     def on_order_filled_message(self, client_order_id: int, price: int, volume: int) -> None:
         """Called when one of your orders is filled, partially or fully.
@@ -154,31 +222,11 @@ class AutoTrader(BaseAutoTrader):
         which may be better than the order's limit price. The volume is
         the number of lots filled at that price.
         """
-        self.logger.info("received order filled for order %d with price %d and volume %d", client_order_id,
-                         price, volume)
-        if client_order_id in self.bids:
-            self.position += volume
-        elif client_order_id in self.asks:
-            self.position -= volume
-            volume = -volume
-
-        # Record price and volume
-        new_vol = self.orders_history["volume"] + volume
-
-        # Case 1: If volume is same direction, find the average
-        if (volume > 0 and self.orders_history["volume"] > 0) or (volume < 0 and self.orders_history["volume"] < 0):
-            self.orders_history["price"] = (abs(volume) * price + abs(self.orders_history["volume"] * self.orders_history["price"])) // abs(new_vol)
-            self.orders_history["volume"] = new_vol
-        # Case 2: If volume is opposite direction, update accordingly
-        else:
-            if abs(volume) < abs(self.orders_history["volume"]):
-                self.orders_history["volume"] = new_vol
-            elif abs(volume) == abs(self.orders_history["volume"]):
-                self.orders_history["price"] = 0
-                self.orders_history["volume"] = 0
-            else:
-                self.orders_history["volume"] = new_vol
-                self.orders_history["price"] = price
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info("received order filled for order %d with price %d and volume %d",
+                             client_order_id, price, volume)
+        side = self._open.get(client_order_id, 0)
+        self.position += side * volume
 			
         hedged_pos_needed = -self.position
         if hedged_pos_needed > 0:
@@ -190,17 +238,17 @@ class AutoTrader(BaseAutoTrader):
         if self.hedge_position < hedged_pos_needed:
             # Buy more futures
             buy_pos = hedged_pos_needed - self.hedge_position
-            order_id = next(self.order_ids)
+            order_id = self._next_id
+            self._next_id += 1
             self.hedge_position += buy_pos
             self.send_hedge_order(order_id, Side.BID, MAX_ASK_NEAREST_TICK, buy_pos)
-            self.hedge_bids.add(order_id)
         elif self.hedge_position > hedged_pos_needed:
             # Sell more futures
             sell_pos = self.hedge_position - hedged_pos_needed
-            order_id = next(self.order_ids)
+            order_id = self._next_id
+            self._next_id += 1
             self.hedge_position -= sell_pos
             self.send_hedge_order(order_id, Side.ASK, MIN_BID_NEAREST_TICK, sell_pos)
-            self.hedge_asks.add(order_id)
 
 
     def on_order_status_message(self, client_order_id: int, fill_volume: int, remaining_volume: int,
@@ -214,8 +262,9 @@ class AutoTrader(BaseAutoTrader):
 
         If an order is cancelled its remaining volume will be zero.
         """
-        self.logger.info("received order status for order %d with fill volume %d remaining %d and fees %d",
-                         client_order_id, fill_volume, remaining_volume, fees)
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info("received order status for order %d with fill volume %d remaining %d and fees %d",
+                             client_order_id, fill_volume, remaining_volume, fees)
 
         if remaining_volume == 0:
             if client_order_id == self.bid_id:
@@ -224,8 +273,11 @@ class AutoTrader(BaseAutoTrader):
                 self.ask_id = 0
 
             # It could be either a bid or an ask
-            self.bids.discard(client_order_id)
-            self.asks.discard(client_order_id)
+            side = self._open.pop(client_order_id, 0)
+            if side == 1:
+                self._n_bids -= 1
+            elif side == -1:
+                self._n_asks -= 1
 
     def on_trade_ticks_message(self, instrument: int, sequence_number: int, ask_prices: List[int],
                                ask_volumes: List[int], bid_prices: List[int], bid_volumes: List[int]) -> None:
@@ -238,5 +290,6 @@ class AutoTrader(BaseAutoTrader):
         If there are less than five prices on a side, then zeros will appear at
         the end of both the prices and volumes arrays.
         """
-        self.logger.info("received trade ticks for instrument %d with sequence number %d", instrument,
-                         sequence_number)
\ No newline at end of file
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info("received trade ticks for instrument %d with sequence number %d", instrument,
+                             sequence_number)
\ No newline at end of file
@@ -16,12 +16,19 @@
 #     License along with Ready Trader Go.  If not, see
 #     <https://www.gnu.org/licenses/>.
 import asyncio
+import collections
 import itertools
 
-from typing import List
-import math
+from typing import List, Tuple
+from math import log as _log, floor as _floor
 import numpy as np
-from scipy.stats import linregress
+
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        """Run the decorated function as plain Python when Numba is not installed."""
+        return lambda function: function
 
 from ready_trader_go import BaseAutoTrader, Instrument, Lifespan, MAXIMUM_ASK, MINIMUM_BID, Side
 
@@ -31,6 +38,105 @@ POSITION_LIMIT = 100
 TICK_SIZE_IN_CENTS = 100
 MIN_BID_NEAREST_TICK = (MINIMUM_BID + TICK_SIZE_IN_CENTS) // TICK_SIZE_IN_CENTS * TICK_SIZE_IN_CENTS
 MAX_ASK_NEAREST_TICK = MAXIMUM_ASK // TICK_SIZE_IN_CENTS * TICK_SIZE_IN_CENTS
+POSITION_HEADROOM = POSITION_LIMIT - LOT_SIZE  # Furthest position from which another lot can be quoted
+VARIANCE_LOOKBACK = 10
+
+# Enum members used on the hot paths, bound once at module scope
+_FUT = Instrument.FUTURE
+_BUY = Side.BUY
+_SELL = Side.SELL
+_GFD = Lifespan.GOOD_FOR_DAY
+
+# Slots of the float64 state array carried between ticks by the tick kernel: the
+# mid price window's Welford mean, sum of squared deviations and count, the
+# reserve pricing time and the best bid, best ask and position at the last requote
+_MEAN, _M2, _MID_N, _T, _LAST_BID, _LAST_ASK, _LAST_POS = range(7)
+_STATE_SIZE = 7
+
+
+# Given an explicit signature, Numba compiles (or loads from its cache) at import
+# time, before the trader connects, instead of on the first order book update
+@njit("UniTuple(int64, 2)(int64, int64, float64, float64, float64, float64, int64)", cache=True)
+def _as_quotes(s_cents: int, q: int, gamma: float, var: float, T: float, log_term: float, tick: int) -> Tuple[int, int]:
+    """Return the Avellaneda-Stoikov bid and ask prices in cents for a mid price in cents."""
+    # Reserve pricing, as the skew s - r of the reservation price r below the mid price s
+    skew = q * gamma * var * T
+
+    # Bid ask spread, with the (2 / gamma) * ln(1 + gamma / k) term precomputed
+    delta = (gamma * var * T + log_term)
+
+    # Ceil of the quote in whole cents, then snap up to the tick with integer ceil division
+    bid_cents = s_cents - int(_floor((skew + delta / 2) * tick))
+    ask_cents = s_cents - int(_floor((skew - delta / 2) * tick))
+    return -(-bid_cents // tick) * tick, -(-ask_cents // tick) * tick
+
+
+@njit("UniTuple(int64, 6)(int64, int64, int64, int64, int64, int64, int64, int64, int64, int64, int64, float64, "
+      "float64, float64[:], float64[:])", cache=True)
+def _tick_decision(bp0: int, ap0: int, pos: int, n_bids: int, n_asks: int, bid_id: int, ask_id: int, bid_price: int,
+                   ask_price: int, bid_size: int, ask_size: int, gamma: float, log_term: float, mid_ring: np.ndarray,
+                   state: np.ndarray) -> Tuple[int, int, int, int, int, int]:
+    """Update the quoting state for a future order book update and decide the orders to send.
+
+    Returns whether to cancel the bid and the ask, then the price and size of a
+    bid and of an ask to insert, where a zero price means no insert.
+    """
+    if state[_T] > 0:
+        state[_T] -= 0.002 # TODO: Try to find appropriate T - t
+    else:
+        state[_T] = 0.000001
+
+    s = (bp0 + ap0) / (2 * TICK_SIZE_IN_CENTS) # mid price in $
+    lookback = VARIANCE_LOOKBACK
+    if int(s) != 0:
+        mid_n = int(state[_MID_N])
+        i = mid_n % lookback
+        n = min(mid_n, lookback)
+        if n == lookback:
+            # Take the oldest mid price, about to be overwritten, back out of the window
+            old = mid_ring[i]
+            diff = old - state[_MEAN]
+            state[_MEAN] -= diff / (n - 1)
+            state[_M2] -= (old - state[_MEAN]) * diff
+            n -= 1
+        mid_ring[i] = s
+        state[_MID_N] += 1
+        diff = s - state[_MEAN]
+        state[_MEAN] += diff / (n + 1)
+        state[_M2] += (s - state[_MEAN]) * diff
+
+    q = 0
+    var = 0.0
+    if state[_MID_N] >= lookback:
+        var = max(state[_M2] / lookback, 0.0)  # not sure to include current mid price
+        q = pos
+
+    # While both quotes are resting, leave them alone until the top of
+    # the book or our position moves; drift in var and T alone waits
+    if (bp0 == state[_LAST_BID] and ap0 == state[_LAST_ASK] and pos == state[_LAST_POS]
+            and bid_id != 0 and ask_id != 0):
+        return 0, 0, 0, 0, 0, 0
+    state[_LAST_BID] = bp0
+    state[_LAST_ASK] = ap0
+    state[_LAST_POS] = pos
+
+    # Prices to be sent in
+    new_bid_price, new_ask_price = _as_quotes((bp0 + ap0) // 2, q, gamma, var, state[_T], log_term,
+                                              TICK_SIZE_IN_CENTS)
+
+    cancel_bid = bid_id != 0 and new_bid_price != bid_price and new_bid_price != 0
+    cancel_ask = ask_id != 0 and new_ask_price != ask_price and new_ask_price != 0
+
+    if (bid_id == 0 or cancel_bid) and new_bid_price != 0 and pos + LOT_SIZE * n_bids <= POSITION_HEADROOM:
+        insert_bid_price = new_bid_price
+    else:
+        insert_bid_price = bid_size = 0
+    if (ask_id == 0 or cancel_ask) and new_ask_price != 0 and pos - LOT_SIZE * n_asks >= -POSITION_HEADROOM:
+        insert_ask_price = new_ask_price
+    else:
+        insert_ask_price = ask_size = 0
+
+    return int(cancel_bid), int(cancel_ask), insert_bid_price, bid_size, insert_ask_price, ask_size
 
 
 class AutoTrader(BaseAutoTrader):
@@ -43,33 +149,50 @@ class AutoTrader(BaseAutoTrader):
     more lots than it has bought) then it increases its bid and ask prices.
     """
 
+    __slots__ = ("order_ids", "_new_order_id", "_open", "_n_bids", "_n_asks", "ask_id", "ask_price", "bid_id",
+                 "bid_price", "position", "_mid_ring", "_state", "gamma", "k", "_log_term", "_cap", "_bid_ring",
+                 "_ask_ring", "_ring_i", "oh_price", "oh_vol", "bid_volume", "ask_volume", "BID_LOT_SIZE",
+                 "ASK_LOT_SIZE", "steps")
+
     def __init__(self, loop: asyncio.AbstractEventLoop, team_name: str, secret: str):
         """Initialise a new instance of the AutoTrader class."""
         super().__init__(loop, team_name, secret)
         self.order_ids = itertools.count(1)
-        self.bids = set()
-        self.asks = set()
+        self._new_order_id = self.order_ids.__next__
+        # Live orders mapped to 1 for bids and -1 for asks, with a count per side
+        self._open = {}
+        self._n_bids = self._n_asks = 0
         self.ask_id = self.ask_price = self.bid_id = self.bid_price = self.position = 0
 
-        self.mid_prices = []
-        self.T = 1 # Reserve pricing time
+        # Ring of the last VARIANCE_LOOKBACK mid prices, and the state the tick
+        # kernel carries between updates, starting from a reserve pricing time of 1
+        self._mid_ring = np.empty(VARIANCE_LOOKBACK, np.float64)
+        self._state = np.zeros(_STATE_SIZE, np.float64)
+        self._state[_T] = 1
 
-        # Previous Price on Orderbook
-        self.bid_prices = np.array([])
-        self.ask_prices = np.array([])
+        self.gamma = 0.05 # TODO: Optimise this
+        self.k = 1 # TODO: Assuming constant liquidity, find K properly (order book liqudity)
+        # Spread term that depends only on gamma and k; recompute it whenever k changes
+        self._log_term = 2 / self.gamma * _log(1 + (self.gamma / self.k))
+
+        # Previous Price on Orderbook, kept in fixed size ring buffers
+        self._cap = 4096
+        self._bid_ring = np.empty(self._cap, np.int64)
+        self._ask_ring = np.empty(self._cap, np.int64)
+        self._ring_i = 0
 
         # At what price / volume our orders were filled
-        self.orders_history = {"price": 0, "volume": 0}
+        self.oh_price = self.oh_vol = 0
 
 
-        self.bid_volume = []
-        self.ask_volume = []
+        # Total volume on each side of the book over the variance window
+        self.bid_volume = collections.deque(maxlen=VARIANCE_LOOKBACK)
+        self.ask_volume = collections.deque(maxlen=VARIANCE_LOOKBACK)
 
         self.BID_LOT_SIZE = 10
         self.ASK_LOT_SIZE = 10
         self.steps = 0
 
-
     def on_error_message(self, client_order_id: int, error_message: bytes) -> None:
         """Called when the exchange detects an error.
 
@@ -77,7 +200,7 @@ class AutoTrader(BaseAutoTrader):
         will identify that order, otherwise the client_order_id will be zero.
         """
         self.logger.warning("error with order %d: %s", client_order_id, error_message.decode())
-        if client_order_id != 0 and (client_order_id in self.bids or client_order_id in self.asks):
+        if client_order_id != 0 and client_order_id in self._open:
             self.on_order_status_message(client_order_id, 0, 0, 0)
 
     def on_hedge_filled_message(self, client_order_id: int, price: int, volume: int) -> None:
@@ -107,31 +230,33 @@ class AutoTrader(BaseAutoTrader):
 
         # if instrument == Instrument.ETF:
         #     # Checks if best bid/asks are better
-        #     if self.orders_history["volume"] > 0:
+        #     if self.oh_vol > 0:
         #         # Find volume to trade
-        #         new_vol = min(bid_volumes[0], self.orders_history["volume"])
+        #         new_vol = min(bid_volumes[0], self.oh_vol)
 
-        #         if bid_prices[0] > self.orders_history["price"] and self.position <= POSITION_LIMIT - (LOT_SIZE * len(self.bids) + new_vol):
+        #         if bid_prices[0] > self.oh_price and self.position <= POSITION_LIMIT - (LOT_SIZE * self._n_bids + new_vol):
         #             self.ask_id = next(self.order_ids)
-        #             # print(min(self.orders_history["volume"], bid_volumes[0]))
+        #             # print(min(self.oh_vol, bid_volumes[0]))
         #             # print(bid_prices[0])
         #             self.send_insert_order(self.ask_id, Side.ASK, bid_prices[0], new_vol,
         #                                    Lifespan.
         #                                    FILL_AND_KILL)
-        #             self.asks.add(self.ask_id)
+        #             self._open[self.ask_id] = -1
+        #             self._n_asks += 1
 
-        #     elif self.orders_history["volume"] < 0:
-        #         new_vol = min(ask_volumes[0], abs(self.orders_history["volume"]))
-        #         if ask_prices[0] < self.orders_history["price"] and self.position >= -POSITION_LIMIT + (LOT_SIZE * len(self.asks) + new_vol):
+        #     elif self.oh_vol < 0:
+        #         new_vol = min(ask_volumes[0], abs(self.oh_vol))
+        #         if ask_prices[0] < self.oh_price and self.position >= -POSITION_LIMIT + (LOT_SIZE * self._n_asks + new_vol):
         #             self.bid_id = next(self.order_ids)
-        #             # print(min(self.orders_history["volume"], bid_volumes[0]))
+        #             # print(min(self.oh_vol, bid_volumes[0]))
         #             # print(ask_prices[0])
         #             self.send_insert_order(self.bid_id, Side.BUY, ask_prices[0], new_vol,
         #                                    Lifespan.FILL_AND_KILL)
-        #             self.bids.add(self.bid_id)
+        #             self._open[self.bid_id] = 1
+        #             self._n_bids += 1
 
 
-        if instrument == Instrument.FUTURE:
+        if instrument == _FUT:
             """
             s - mid market price
             q - difference between current size and counterparty order size
@@ -142,86 +267,71 @@ class AutoTrader(BaseAutoTrader):
             r - reservation price
             delta - optimal spread // 2
             """
-            
-            s = (bid_prices[0] + ask_prices[0]) / (2 * TICK_SIZE_IN_CENTS) # mid price in $
-            q = 0
-            gamma = 0.05 # TODO: Optimise this
-            var = 0
-            k = 1 # TODO: Assuming constant liquidity
-            if self.T > 0:
-                self.T -= 0.002 # TODO: Try to find appropriate T - t
+
+            # TODO: Better way to find K; an estimate should only kick in once the
+            # variance window of the tick kernel is full, and reads earlier prices
+            """
+            K using changing prices / timesteps
+            lookback = VARIANCE_LOOKBACK
+            self.k = len(set(np.take(self._bid_ring, np.arange(self._ring_i - lookback, self._ring_i), mode='wrap'))) / lookback
+            self._log_term = 2 / self.gamma * _log(1 + (self.gamma / self.k))
+            """
+
+            """
+            # K using current spread, as 1 / least squares slope of the spread
+            # (k must come out positive or _log gives a domain error)
+            spread_lookback = 10
+            recent = np.arange(self._ring_i - spread_lookback, self._ring_i)
+            spread = np.take(self._ask_ring, recent, mode='wrap') - np.take(self._bid_ring, recent, mode='wrap')
+            time_index = np.arange(spread_lookback) - (spread_lookback - 1) / 2
+            self.k = (time_index * time_index).sum() / (time_index * spread).sum()
+            self._log_term = 2 / self.gamma * _log(1 + (self.gamma / self.k))
+            """
+
+            # TODO: Momentum LOTSIZE -- Try to properly model lotsize
+            """
+            if sum(self.bid_volume) > sum(self.ask_volume):
+                self.BID_LOT_SIZE = math.ceil(LOT_SIZE + 5)
+                self.ASK_LOT_SIZE = math.ceil(LOT_SIZE - 5)
             else:
-                self.T = 0.000001
-
-            if int(s) != 0:
-                self.mid_prices.append(s)
-
-            lookback = 10
-
-            if len(self.mid_prices) >= lookback:
-                var = np.var(self.mid_prices[-1:-lookback - 1:-1])  # not sure to include current mid price
-                q = self.position
-                # TODO: Better way to find K
-                """
-                K using changing prices / timesteps
-                k = (len(set(self.bid_prices[-1:-lookback-1:-1]))) / lookback
-                """
-
-                """               
-                # K using current spread THIS IS GIVING MATH DOMAIN ERROR
-                spread_lookback = 10
-                spread = self.ask_prices[-spread_lookback:] - self.bid_prices[-spread_lookback:]
-                print(spread)
-                time_index = np.array(range(spread_lookback))
-                model = linregress(time_index, spread)
-                k = 1 / model.slope
-                """
-
-                # TODO: Momentum LOTSIZE -- Try to properly model lotsize
-                """
-                if sum(self.bid_volume[-1:-lookback - 1:-1]) > sum(self.ask_volume[-1:-lookback - 1:-1]):
-                    self.BID_LOT_SIZE = math.ceil(LOT_SIZE + 5)
-                    self.ASK_LOT_SIZE = math.ceil(LOT_SIZE - 5)
-                else:
-                    self.ASK_LOT_SIZE = math.ceil(LOT_SIZE + 5)
-                    self.BID_LOT_SIZE = math.ceil(LOT_SIZE - 5)
-                """
-
-
-            # Reserve pricing
-            r = s - (q * gamma * var * self.T)
-
-            # TODO: Find K properly (order book liqudity)
-            delta = (gamma * var * self.T + (2 / gamma * math.log(1 + (gamma / k))))
-
-            # Prices to be sent in
-            new_bid_price = math.ceil((r - delta / 2)) * TICK_SIZE_IN_CENTS
-            new_ask_price = math.ceil((r + delta / 2)) * TICK_SIZE_IN_CENTS
-
-            if self.bid_id != 0 and new_bid_price not in (self.bid_price, 0):
+                self.ASK_LOT_SIZE = math.ceil(LOT_SIZE + 5)
+                self.BID_LOT_SIZE = math.ceil(LOT_SIZE - 5)
+            """
+
+            # Add volumes and prices after the estimates above have read them
+            self.bid_volume.append(sum(bid_volumes))
+            self.ask_volume.append(sum(ask_volumes))
+            self._bid_ring[self._ring_i % self._cap] = bid_prices[0]
+            self._ask_ring[self._ring_i % self._cap] = ask_prices[0]
+            self._ring_i += 1
+
+            # All of the numeric work and order decisions run in the tick kernel;
+            # only the calls to the exchange are made from here
+            cancel_bid, cancel_ask, bid_price, bid_size, ask_price, ask_size = _tick_decision(
+                bid_prices[0], ask_prices[0], self.position, self._n_bids, self._n_asks, self.bid_id, self.ask_id,
+                self.bid_price, self.ask_price, self.BID_LOT_SIZE, self.ASK_LOT_SIZE, self.gamma, self._log_term,
+                self._mid_ring, self._state)
+
+            if cancel_bid:
                 self.send_cancel_order(self.bid_id)
                 self.bid_id = 0
-            if self.ask_id != 0 and new_ask_price not in (self.ask_price, 0):
+            if cancel_ask:
                 self.send_cancel_order(self.ask_id)
                 self.ask_id = 0
 
-            if self.bid_id == 0 and new_bid_price != 0 and self.position <= POSITION_LIMIT - (LOT_SIZE * len(self.bids) + LOT_SIZE):
-                self.bid_id = next(self.order_ids)
-                self.bid_price = new_bid_price
-                self.send_insert_order(self.bid_id, Side.BUY, new_bid_price, self.BID_LOT_SIZE, Lifespan.GOOD_FOR_DAY)
-                self.bids.add(self.bid_id)
-
-            if self.ask_id == 0 and new_ask_price != 0 and self.position >= -POSITION_LIMIT + (LOT_SIZE * len(self.asks) + LOT_SIZE):
-                self.ask_id = next(self.order_ids)
-                self.ask_price = new_ask_price
-                self.send_insert_order(self.ask_id, Side.SELL, new_ask_price, self.ASK_LOT_SIZE, Lifespan.GOOD_FOR_DAY)
-                self.asks.add(self.ask_id)
+            if bid_price != 0:
+                self.bid_id = self._new_order_id()
+                self.bid_price = bid_price
+                self.send_insert_order(self.bid_id, _BUY, bid_price, bid_size, _GFD)
+                self._open[self.bid_id] = 1
+                self._n_bids += 1
 
-            # Add volume at the end and prices after sending order
-            self.bid_volume.append(sum(bid_volumes))
-            self.ask_volume.append(sum(ask_volumes))
-            self.ask_prices = np.append(self.ask_prices, ask_prices[0])
-            self.bid_prices = np.append(self.bid_prices, bid_prices[0])
+            if ask_price != 0:
+                self.ask_id = self._new_order_id()
+                self.ask_price = ask_price
+                self.send_insert_order(self.ask_id, _SELL, ask_price, ask_size, _GFD)
+                self._open[self.ask_id] = -1
+                self._n_asks += 1
 
     def on_order_filled_message(self, client_order_id: int, price: int, volume: int) -> None:
         """Called when one of your orders is filled, partially or fully.
@@ -232,43 +342,44 @@ class AutoTrader(BaseAutoTrader):
         """
         self.logger.info("received order filled for order %d with price %d and volume %d", client_order_id,
                          price, volume)
-        if client_order_id in self.bids:
+        side = self._open.get(client_order_id, 0)
+        if side == 1:
             # self.send_hedge_order(next(self.order_ids), Side.ASK, MIN_BID_NEAREST_TICK, volume)
             # print(f"BUY. price {price}, volume: {volume}")
             self.position += volume
-        elif client_order_id in self.asks:
+        elif side == -1:
             # self.send_hedge_order(next(self.order_ids), Side.BID, MAX_ASK_NEAREST_TICK, volume)
             # print(f"SELL. price {price}, volume: {volume}")
             self.position -= volume
             volume = -volume
 
         # Record price and volume
-        new_vol = self.orders_history["volume"] + volume
+        new_vol = self.oh_vol + volume
 
         # Case 1: If volume is same direction
-        if (volume > 0 and self.orders_history["volume"] > 0) or (volume < 0 and self.orders_history["volume"] < 0):
+        if (volume > 0 and self.oh_vol > 0) or (volume < 0 and self.oh_vol < 0):
             # Just find average
-            self.orders_history["price"] = (abs(volume) * price + abs(self.orders_history["volume"] * self.orders_history["price"])) // abs(new_vol)
-            self.orders_history["volume"] = new_vol
+            self.oh_price = (abs(volume) * price + abs(self.oh_vol * self.oh_price)) // abs(new_vol)
+            self.oh_vol = new_vol
 
         # Case 2: If volume is opposite direction
         else:
             # if abs(volume) < abs(prev volume):
-            if abs(volume) < abs(self.orders_history["volume"]):
+            if abs(volume) < abs(self.oh_vol):
                 # Still same direction, just minus off volume
-                self.orders_history["volume"] = new_vol
+                self.oh_vol = new_vol
             # else if ==
-            elif abs(volume) == abs(self.orders_history["volume"]):
+            elif abs(volume) == abs(self.oh_vol):
                 # price = 0
-                self.orders_history["price"] = 0
-                self.orders_history["volume"] = 0
+                self.oh_price = 0
+                self.oh_vol = 0
             # else if directional swap
             else:
                 # update volume and put curr price
-                self.orders_history["volume"] = new_vol
-                self.orders_history["price"] = price
+                self.oh_vol = new_vol
+                self.oh_price = price
 
-        # print(self.orders_history)
+        # print(self.oh_price, self.oh_vol)
 
 
 
@@ -293,8 +404,11 @@ class AutoTrader(BaseAutoTrader):
                 self.ask_id = 0
 
             # It could be either a bid or an ask
-            self.bids.discard(client_order_id)
-            self.asks.discard(client_order_id)
+            side = self._open.pop(client_order_id, 0)
+            if side == 1:
+                self._n_bids -= 1
+            elif side == -1:
+                self._n_asks -= 1
 
     def on_trade_ticks_message(self, instrument: int, sequence_number: int, ask_prices: List[int],
                                ask_volumes: List[int], bid_prices: List[int], bid_volumes: List[int]) -> None:
@@ -21,6 +21,7 @@ import itertools
 from typing import List
 from enum import Enum
 from math import ceil, floor
+import numpy as np
 from ready_trader_go import BaseAutoTrader, Instrument, Lifespan, MAXIMUM_ASK, MINIMUM_BID, Side
 
 LOT_SIZE = 10
@@ -28,6 +29,17 @@ POSITION_LIMIT = 100
 TICK_SIZE_IN_CENTS = 100
 MIN_BID_NEAREST_TICK = (MINIMUM_BID + TICK_SIZE_IN_CENTS) // TICK_SIZE_IN_CENTS * TICK_SIZE_IN_CENTS
 MAX_ASK_NEAREST_TICK = MAXIMUM_ASK // TICK_SIZE_IN_CENTS * TICK_SIZE_IN_CENTS
+MOMENTUM_LOOKBACK = 5
+POSITION_HEADROOM = POSITION_LIMIT - LOT_SIZE  # Furthest position from which another lot can be quoted
+
+# Enum members used on the hot paths, bound once at module scope
+_FUT = Instrument.FUTURE
+_ETF = Instrument.ETF
+_BUY = Side.BUY
+_SELL = Side.SELL
+_ASK = Side.ASK
+_BID = Side.BID
+_GFD = Lifespan.GOOD_FOR_DAY
 
 class Momentum(Enum):
     Up = "up"
@@ -43,19 +55,27 @@ class AutoTrader(BaseAutoTrader):
     more lots than it has bought) then it increases its bid and ask prices.
     """
 
+    __slots__ = ("order_ids", "_new_order_id", "_open", "_n_bids", "_n_asks", "ask_id", "ask_price", "bid_id",
+                 "bid_price", "position", "hedge_position", "pending_hedge_position", "future_price", "momentum",
+                 "hedge_bids", "hedge_asks", "_bv", "_av", "_vi")
+
     def __init__(self, loop: asyncio.AbstractEventLoop, team_name: str, secret: str):
         """Initialise a new instance of the AutoTrader class."""
         super().__init__(loop, team_name, secret)
         self.order_ids = itertools.count(1)
-        self.bids = set()
-        self.asks = set()
+        self._new_order_id = self.order_ids.__next__
+        # Live orders mapped to 1 for bids and -1 for asks, with a count per side
+        self._open = {}
+        self._n_bids = self._n_asks = 0
         self.ask_id = self.ask_price = self.bid_id = self.bid_price = self.position = self.hedge_position = self.pending_hedge_position = 0
         self.future_price = 0
         self.momentum = None
         self.hedge_bids = set()
         self.hedge_asks = set()
-        self.bid_volume = []
-        self.ask_volume = []
+        # Total book volume on each side over the last MOMENTUM_LOOKBACK ETF updates
+        self._bv = np.zeros(MOMENTUM_LOOKBACK, np.int64)
+        self._av = np.zeros(MOMENTUM_LOOKBACK, np.int64)
+        self._vi = 0
 
     def on_error_message(self, client_order_id: int, error_message: bytes) -> None:
         """Called when the exchange detects an error.
@@ -64,7 +84,7 @@ class AutoTrader(BaseAutoTrader):
         will identify that order, otherwise the client_order_id will be zero.
         """
         self.logger.warning("error with order %d: %s", client_order_id, error_message.decode())
-        if client_order_id != 0 and (client_order_id in self.bids or client_order_id in self.asks):
+        if client_order_id != 0 and client_order_id in self._open:
             self.on_order_status_message(client_order_id, 0, 0, 0)
 
     def on_hedge_filled_message(self, client_order_id: int, price: int, volume: int) -> None:
@@ -100,45 +120,56 @@ class AutoTrader(BaseAutoTrader):
                          sequence_number)
 
         # Get mid prices
-        if instrument == Instrument.FUTURE:
+        if instrument == _FUT:
             self.future_price = future_price = (ask_prices[0] + bid_prices[0]) // 2
-        if instrument == Instrument.ETF and self.future_price != 0:
-            etf_price = (ask_prices[0] + bid_prices[0]) // 2
+        if instrument == _ETF and self.future_price != 0:
+            bp0 = bid_prices[0]
+            ap0 = ask_prices[0]
+            etf_price = (ap0 + bp0) // 2
 
+            # An empty side of the book has a zero price, and is not quoted on
             price_adjustment = - (self.position // LOT_SIZE) * TICK_SIZE_IN_CENTS
-            new_bid_price = bid_prices[0] + price_adjustment if bid_prices[0] != 0 else 0
-            new_ask_price = ask_prices[0] + price_adjustment if ask_prices[0] != 0 else 0
+            new_bid_price = bp0 + price_adjustment
+            new_ask_price = ap0 + price_adjustment
 
-            self.bid_volume.append(sum(bid_volumes))
-            self.ask_volume.append(sum(ask_volumes))
+            i = self._vi % MOMENTUM_LOOKBACK
+            self._bv[i] = sum(bid_volumes)
+            self._av[i] = sum(ask_volumes)
+            self._vi += 1
 
-            # Average volume past 5 timesteps
-            if len(self.bid_volume) >= 5:
-                if sum(bid_volumes[-1:-5]) < sum(ask_volumes[-1:-5]):
+            # Average volume past 5 timesteps, which once full is the whole ring
+            if self._vi >= MOMENTUM_LOOKBACK:
+                if self._bv.sum() < self._av.sum():
                     self.momentum = Momentum.Up
                 else:
                     self.momentum = Momentum.Down
 
-            if self.bid_id != 0 and new_bid_price not in (self.bid_price, 0):
+            nb = self._n_bids
+            na = self._n_asks
+            pos = self.position
+
+            if self.bid_id != 0 and new_bid_price != self.bid_price and bp0 != 0:
                 self.send_cancel_order(self.bid_id)
                 self.bid_id = 0
-            if self.ask_id != 0 and new_ask_price not in (self.ask_price, 0):
+            if self.ask_id != 0 and new_ask_price != self.ask_price and ap0 != 0:
                 self.send_cancel_order(self.ask_id)
                 self.ask_id = 0
 
-            if self.bid_id == 0 and new_bid_price != 0 and etf_price < self.future_price and self.position <= POSITION_LIMIT - (LOT_SIZE * len(self.bids) + LOT_SIZE):
+            if self.bid_id == 0 and bp0 != 0 and etf_price < self.future_price and pos + LOT_SIZE * nb <= POSITION_HEADROOM:
                 bid_size = LOT_SIZE
-                self.bid_id = next(self.order_ids)
+                self.bid_id = self._new_order_id()
                 self.bid_price = new_bid_price
-                self.send_insert_order(self.bid_id, Side.BUY, new_bid_price, bid_size, Lifespan.GOOD_FOR_DAY)
-                self.bids.add(self.bid_id)
+                self.send_insert_order(self.bid_id, _BUY, new_bid_price, bid_size, _GFD)
+                self._open[self.bid_id] = 1
+                self._n_bids += 1
 
-            if self.ask_id == 0 and new_ask_price != 0 and etf_price > self.future_price and self.position >= -POSITION_LIMIT + (LOT_SIZE * len(self.asks) + LOT_SIZE):
+            if self.ask_id == 0 and ap0 != 0 and etf_price > self.future_price and pos - LOT_SIZE * na >= -POSITION_HEADROOM:
                 ask_size = LOT_SIZE
-                self.ask_id = next(self.order_ids)
+                self.ask_id = self._new_order_id()
                 self.ask_price = new_ask_price
-                self.send_insert_order(self.ask_id, Side.SELL, new_ask_price, ask_size, Lifespan.GOOD_FOR_DAY)
-                self.asks.add(self.ask_id)
+                self.send_insert_order(self.ask_id, _SELL, new_ask_price, ask_size, _GFD)
+                self._open[self.ask_id] = -1
+                self._n_asks += 1
 
     def on_order_filled_message(self, client_order_id: int, price: int, volume: int) -> None:
         """Called when one of your orders is filled, partially or fully.
@@ -152,30 +183,31 @@ class AutoTrader(BaseAutoTrader):
 
         # ETF BID and etf < future
         # We will place FUTURES ASKS
-        if client_order_id in self.bids:
+        side = self._open.get(client_order_id, 0)
+        if side == 1:
             self.position += volume
             # if momentum == up, we short less *.9 futures 
             # else, we short more *1.1 futures
             hedge_volume = ceil(volume * 0.9) if self.momentum == Momentum.Up else floor(volume * 1.1)
             potential_total_hedge = self.hedge_position + self.pending_hedge_position - hedge_volume
             if hedge_volume != 0 and  potential_total_hedge >= -POSITION_LIMIT:
-                order_id = next(self.order_ids)
+                order_id = self._new_order_id()
                 self.pending_hedge_position -= hedge_volume
-                self.send_hedge_order(order_id, Side.ASK, MIN_BID_NEAREST_TICK, hedge_volume)
+                self.send_hedge_order(order_id, _ASK, MIN_BID_NEAREST_TICK, hedge_volume)
                 self.hedge_asks.add(order_id)
 
         # ETF ASKS and etf >= future
         # We will place FUTURE BIDS
-        elif client_order_id in self.asks:
+        elif side == -1:
             self.position -= volume
             # if momentum == down, we long less *.9 futures
             # else, we long more *1.1 futures
             hedge_volume = ceil(volume * 0.9) if self.momentum == Momentum.Down else floor(volume * 1.1)
             potential_total_hedge = self.hedge_position + self.pending_hedge_position + hedge_volume
             if hedge_volume != 0 and potential_total_hedge <= POSITION_LIMIT:
-                order_id = next(self.order_ids)
+                order_id = self._new_order_id()
                 self.pending_hedge_position += hedge_volume
-                self.send_hedge_order(order_id, Side.BID, MAX_ASK_NEAREST_TICK, hedge_volume)
+                self.send_hedge_order(order_id, _BID, MAX_ASK_NEAREST_TICK, hedge_volume)
                 self.hedge_bids.add(order_id)
 
     def on_order_status_message(self, client_order_id: int, fill_volume: int, remaining_volume: int,
@@ -197,25 +229,28 @@ class AutoTrader(BaseAutoTrader):
             elif client_order_id == self.ask_id:
                 self.ask_id = 0
             # It could be either a bid or an ask
-            self.bids.discard(client_order_id)
-            self.asks.discard(client_order_id)
+            side = self._open.pop(client_order_id, 0)
+            if side == 1:
+                self._n_bids -= 1
+            elif side == -1:
+                self._n_asks -= 1
 
         hedged_pos_needed = -self.position
         # if there are >= 10 unhedged positions at any point in time
         if self.hedge_position < hedged_pos_needed - 10:
             # buy more futures
             buy_pos = (hedged_pos_needed - 10) - self.hedge_position
-            order_id = next(self.order_ids)
+            order_id = self._new_order_id()
             self.pending_hedge_position += buy_pos
-            self.send_hedge_order(order_id, Side.BID, MAX_ASK_NEAREST_TICK, buy_pos)
+            self.send_hedge_order(order_id, _BID, MAX_ASK_NEAREST_TICK, buy_pos)
             self.hedge_bids.add(order_id)
 
         elif self.hedge_position > hedged_pos_needed + 10:
             # sell more futures
             sell_pos = self.hedge_position - (hedged_pos_needed + 10)
-            order_id = next(self.order_ids)
+            order_id = self._new_order_id()
             self.pending_hedge_position -= sell_pos
-            self.send_hedge_order(order_id, Side.ASK, MIN_BID_NEAREST_TICK, sell_pos)
+            self.send_hedge_order(order_id, _ASK, MIN_BID_NEAREST_TICK, sell_pos)
             self.hedge_asks.add(order_id)
 
     def on_trade_ticks_message(self, instrument: int, sequence_number: int, ask_prices: List[int],
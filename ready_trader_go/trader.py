@@ -96,6 +96,14 @@ async def __start_autotrader(auto_trader: BaseAutoTrader, config: Dict[str, Any]
 
 def main(name: str = "autotrader") -> None:
     """Import the 'AutoTrader' class from the named module and run it."""
+    # Run the auto-trader on uvloop's libuv based event loop when it is installed
+    try:
+        import uvloop
+    except ImportError:
+        pass
+    else:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
     app = Application(name, __config_validator)
 
     sys.path.insert(0, os.getcwd())